@@ -1,4 +1,9 @@
 """Main script for running the book generation system"""
+import asyncio
+import hashlib
+import json
+import os
+
 from dotenv import load_dotenv
 
 from agents import StoryAgents
@@ -91,17 +96,32 @@ def main():
 
     num_stories = 10
     # Create agents
-    story_outline_Agents = StoryAgents(agent_config)
-    agents = story_outline_Agents.create_agents(initial_prompt, num_stories)
+    story_agents = StoryAgents(agent_config)
+    agents = story_agents.create_agents(initial_prompt, num_stories)
+    
+    # Reuse a previously generated outline for the same inputs
+    os.makedirs("story_output", exist_ok=True)
+    outline_key = hashlib.sha256(
+        f"{initial_prompt}|{num_stories}|{os.getenv('AZURE_OPENAI_MODEL')}".encode()
+    ).hexdigest()[:16]
+    outline_cache = os.path.join("story_output", f"outline_{outline_key}.json")
     
-    # Generate the outline
-    outline_gen = OutlineGenerator(agents, agent_config)
-    print("Generating stories outline...")
-    outline = outline_gen.generate_outline(initial_prompt, num_stories)
+    if os.path.exists(outline_cache):
+        print(f"Loading cached stories outline from {outline_cache}...")
+        with open(outline_cache, "r", encoding="utf-8") as f:
+            outline = json.load(f)
+    else:
+        # Generate the outline
+        outline_gen = OutlineGenerator(agents, agent_config)
+        print("Generating stories outline...")
+        outline = outline_gen.generate_outline(initial_prompt, num_stories)
+        # Don't cache the placeholder outline produced when generation fails
+        if outline and not any("[To be determined]" in story['prompt'] for story in outline):
+            with open(outline_cache, "w", encoding="utf-8") as f:
+                json.dump(outline, f, ensure_ascii=False)
     
-    # Create new agents with outline context
-    story_agents = StoryAgents(agent_config, outline)
-    agents_with_context = story_agents.create_agents(initial_prompt, num_stories)
+    # Give the same agents the outline context
+    agents_with_context = story_agents.bind_outline(outline)
     
     # Initialize story generator with contextual agents
     story_gen = StoryGenerator(agents_with_context, agent_config, outline)
@@ -115,16 +135,18 @@ def main():
     
     # Save the outline for reference
     print("\nSaving outline to file...")
-    with open("story_output/outline.txt", "w") as f:
-        for story in outline:
-            f.write(f"\nStory {story['story_number']}: {story['title']}\n")
-            f.write("-" * 50 + "\n")
-            f.write(story['prompt'] + "\n")
+    with open("story_output/outline.txt", "w", encoding="utf-8") as f:
+        f.write("".join(
+            f"\nStory {story['story_number']}: {story['title']}\n"
+            + "-" * 50 + "\n"
+            + story['prompt'] + "\n"
+            for story in outline
+        ))
     
     # Generate the stories using the outline
     print("\nGenerating storie...")
     if outline:
-        story_gen.generate_stories(outline)
+        asyncio.run(story_gen.generate_stories(outline))
     else:
         print("Error: No outline was generated.")
 
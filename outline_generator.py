@@ -1,42 +1,41 @@
 """Generate book outlines using AutoGen agents with improved error handling"""
+import json
 import re
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import autogen
 
+# Pattern used to salvage story headers and bullet points from free-form replies
+_EMERGENCY_RE = re.compile(
+    r'^[ \t]*(?P<header>\**Story (?P<number>\d+)\b(?P<title>.*))$'
+    r'|^[ \t]*(?P<bullet>-.*\S.*)$',
+    re.MULTILINE
+)
+
 
 class OutlineGenerator:
     def __init__(self, agents: Dict[str, autogen.ConversableAgent], agent_config: Dict):
         self.agents = agents
         self.agent_config = agent_config
 
+    def _generate_reply_text(self, agent_name: str, messages: List[Dict]) -> str:
+        """Get a single reply from an agent as plain text"""
+        reply = self.agents[agent_name].generate_reply(messages=messages)
+        content = reply.get("content", "") if isinstance(reply, dict) else reply
+        return content or ""
+
     def generate_outline(self, initial_prompt: str, num_stories: int = 25) -> List[Dict]:
         """Generate a stories outline based on initial prompt"""
         print("\nGenerating outline...")
 
-        
-        groupchat = autogen.GroupChat(
-            agents=[
-                self.agents["user_proxy"],
-                self.agents["story_planner"],
-                self.agents["world_builder"],
-                self.agents["outline_creator"]
-            ],
-            messages=[],
-            max_round=4,
-            speaker_selection_method="round_robin"
-        )
-        
-        manager = autogen.GroupChatManager(groupchat=groupchat, llm_config=self.agent_config)
-
         outline_prompt = f"""Let's create a {num_stories}-story outline for a book with the following premise:
 
 {initial_prompt}
 
-Process:
-1. Story Planner: Create a series high-level stories arc and major plot points
-2. World Builder: Suggest key settings and world elements needed
-3. Outline Creator: Generate a detailed outline with each stories titles and prompts. They are a series of stories that can also be read independently and different. 
+Guidelines:
+1. Create a series high-level stories arc and major plot points
+2. Decide the key settings and world elements needed
+3. Generate a detailed outline with each stories titles and prompts. They are a series of stories that can also be read independently and different. 
 4. Each story should have a clear beginning, middle, and end, with a focus on character development and plot progression.
 5. Please write the story in Chinese
 6. The stories must be independent of each other, and the content must not be repeated
@@ -46,122 +45,84 @@ Start with story 1 and number stories sequentially.
 
 Make sure there are at least 3 scenes in each story.
 
-[Continue with remaining stories]
-
 Please output all stories, do not leave out any stories. Think through every story carefully, none should be to be determined later
 It is of utmost importance that you detail out every story.
 There should be clear content for each story. There should be a total of {num_stories} stories of the series.
 
-End the outline with 'END OF OUTLINE'"""
+Return the outline as a JSON object."""
+
+        messages = [{"role": "user", "content": outline_prompt}]
 
         try:
-            # Initiate the chat
-            self.agents["user_proxy"].initiate_chat(
-                manager,
-                message=outline_prompt
-            )
-
-            # Extract the outline from the chat messages
-            return self._process_outline_results(groupchat.messages, num_stories)
+            # JSON mode call to the outline creator
+            content = self._generate_reply_text("outline_creator", messages)
+            messages.append({"role": "assistant", "name": "outline_creator", "content": content})
+
+            # Extract the outline from the reply
+            return self._process_outline_results(messages, num_stories)
             
         except Exception as e:
             print(f"Error generating outline: {str(e)}")
             # Try to salvage any outline content we can find
-            return self._emergency_outline_processing(groupchat.messages, num_stories)
+            return self._emergency_outline_processing(messages, num_stories)
 
     def _get_sender(self, msg: Dict) -> str:
         """Helper to get sender from message regardless of format"""
         return msg.get("sender") or msg.get("name", "")
 
-    def _extract_outline_content(self, messages: List[Dict]) -> str:
-        """Extract outline content from messages with better error handling"""
-        print("Searching for outline content in messages...")
-        
-        # Look for content between "OUTLINE:" and "END OF OUTLINE"
-        for msg in reversed(messages):
-            content = msg.get("content", "")
-            if "OUTLINE:" in content:
-                # Extract content between OUTLINE: and END OF OUTLINE
-                start_idx = content.find("OUTLINE:")
-                end_idx = content.find("END OF OUTLINE")
-                
-                if start_idx != -1:
-                    if end_idx != -1:
-                        return content[start_idx:end_idx].strip()
-                    else:
-                        # If no END OF OUTLINE marker, take everything after OUTLINE:
-                        return content[start_idx:].strip()
-                        
-        # Fallback: look for content with story markers
-        for msg in reversed(messages):
-            content = msg.get("content", "")
-            if "Story 1:" in content or "**Story 1:**" in content:
-                return content
-
-        return ""
-
-    def _process_outline_results(self, messages: List[Dict], num_stories: int) -> List[Dict]:
-        """Extract and process the outline with strict format requirements"""
-        outline_content = self._extract_outline_content(messages)
-        
-        if not outline_content:
-            print("No structured outline found, attempting emergency processing...")
-            return self._emergency_outline_processing(messages, num_stories)
+    def _parse_outline_json(self, messages: List[Dict]) -> Optional[List[Dict]]:
+        """Parse the JSON mode outline, returning None if the reply isn't JSON"""
+        content = next(
+            (msg.get("content") or "" for msg in reversed(messages)
+             if self._get_sender(msg) == "outline_creator"),
+            ""
+        )
+        # Tolerate the object being wrapped in a markdown code fence
+        start_idx, end_idx = content.find("{"), content.rfind("}")
+        try:
+            data = json.loads(content[start_idx:end_idx + 1])
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get("stories"), list):
+            return None
 
         stories = []
-        story_sections = re.split(r'Story \d+:', outline_content)
-        
-        for i, section in enumerate(story_sections[1:], 1):  # Skip first empty section
+        for i, story in enumerate(data["stories"], 1):
             try:
-                    # Extract required components
-                title_match = re.search(r'\*?\*?Title:\*?\*?\s*(.+?)(?=\n|$)', section, re.IGNORECASE)
-                events_match = re.search(r'\*?\*?Key Events:\*?\*?\s*(.*?)(?=\*?\*?Character Developments:|$)', section, re.DOTALL | re.IGNORECASE)
-                setting_match = re.search(r'\*?\*?Setting:\*?\*?\s*(.*?)(?=\*?\*?Tone:|$)', section, re.DOTALL | re.IGNORECASE)
-                tone_match = re.search(r'\*?\*?Tone:\*?\*?\s*(.*?)(?=\*?\*?Story \d+:|$)', section, re.DOTALL | re.IGNORECASE)
-
-                # If no explicit title match, try to get it from the story header
-                if not title_match:
-                    title_match = re.search(r'\*?\*?Story \d+:\s*(.+?)(?=\n|$)', section)
-
-                # Verify all components exist
-                if not all([title_match, events_match, setting_match, tone_match]):
-                    print(f"Missing required components in Story {i}")
-                    missing = []
-                    if not title_match: missing.append("Title")
-                    if not events_match: missing.append("Key Events")
-                    if not setting_match: missing.append("Setting")
-                    if not tone_match: missing.append("Tone")
-                    print(f"  Missing: {', '.join(missing)}")
+                key_events = [str(event).strip() for event in story["key_events"]]
+                if len(key_events) < 3:
+                    print(f"Story {i} has fewer than 3 events")
                     continue
 
-                # Format story content
-                story_info = {
-                    "story_number": i,
-                    "title": title_match.group(1).strip(),
+                events = "\n".join(f"- {event}" for event in key_events)
+                stories.append({
+                    "story_number": int(story.get("story_number", i)),
+                    "title": str(story["title"]).strip(),
                     "prompt": "\n".join([
-                        f"- Key Events: {events_match.group(1).strip()}",
-                        f"- Setting: {setting_match.group(1).strip()}",
-                        f"- Tone: {tone_match.group(1).strip()}"
+                        f"- Key Events: {events}",
+                        f"- Setting: {str(story['setting']).strip()}",
+                        f"- Tone: {str(story['tone']).strip()}"
                     ])
-                }
-                
-                # Verify events (at least 3)
-                events = re.findall(r'-\s*(.+?)(?=\n|$)', events_match.group(1))
-                if len(events) < 3:
-                    print(f"Story {i} has fewer than 3 events")
-                    continue
-
-                stories.append(story_info)
+                })
 
-            except Exception as e:
-                print(f"Error processing Story {i}: {str(e)}")
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Error processing Story {i}: missing or invalid {str(e)}")
                 continue
 
-        # If we don't have enough valid stories, raise error to trigger retry
+        return stories
+
+    def _process_outline_results(self, messages: List[Dict], num_stories: int) -> List[Dict]:
+        """Extract and process the outline with strict format requirements"""
+        stories = self._parse_outline_json(messages)
+        if stories is None:
+            print("No structured outline found, attempting emergency processing...")
+            return self._emergency_outline_processing(messages, num_stories)
+
+        # Keep the valid stories, padding any missing ones with placeholders
         if len(stories) < num_stories:
-            raise ValueError(f"Only processed {len(stories)} valid stories out of {num_stories} required")
+            print(f"Only processed {len(stories)} valid stories out of {num_stories} required")
 
-        return stories
+        return self._verify_story_sequence(stories, num_stories)
 
     def _verify_story_sequence(self, stories: List[Dict], num_stories: int) -> List[Dict]:
         """Verify and fix story numbering"""
@@ -193,33 +154,30 @@ End the outline with 'END OF OUTLINE'"""
         stories = []
         current_story = None
         
-        # Look through all messages for any story content
-        for msg in messages:
-            content = msg.get("content", "")
-            lines = content.split('\n')
-            
-            for line in lines:
-                # Look for story markers
-                story_match = re.search(r'Story (\d+)', line)
-                if story_match and "Key events:" in content:
-                    if current_story:
-                        stories.append(current_story)
-                    
-                    current_story = {
-                        'story_number': int(story_match.group(1)),
-                        'title': line.split(':')[-1].strip() if ':' in line else f"Story {story_match.group(1)}",
-                        'prompt': []
-                    }
+        # Scan all messages once for story headers and bullet points
+        full_content = "\n".join(msg.get("content") or "" for msg in messages)
+        for match in _EMERGENCY_RE.finditer(full_content):
+            if match.group('header'):
+                if current_story and current_story['prompt']:
+                    stories.append(current_story)
                 
-                # Collect bullet points
-                if current_story and line.strip().startswith('-'):
-                    current_story['prompt'].append(line.strip())
+                title = match.group('title').strip("*: ")
+                current_story = {
+                    'story_number': int(match.group('number')),
+                    'title': title or f"Story {match.group('number')}",
+                    'prompt': []
+                }
             
-            # Add the last story if it exists
-            if current_story and current_story.get('prompt'):
-                current_story['prompt'] = '\n'.join(current_story['prompt'])
-                stories.append(current_story)
-                current_story = None
+            # Collect bullet points
+            elif current_story:
+                current_story['prompt'].append(match.group('bullet').strip())
+        
+        # Add the last story if it exists
+        if current_story and current_story['prompt']:
+            stories.append(current_story)
+        
+        for story in stories:
+            story['prompt'] = '\n'.join(story['prompt'])
         
         if not stories:
             print("Emergency processing failed to find any stories")
@@ -1,11 +1,85 @@
 """Main class for generating stories using AutoGen with improved iteration control"""
+import asyncio
+import hashlib
+import json
+import logging
 import os
 import re
-import time
-from typing import Dict, List, Optional
+import shutil
+from collections import deque
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
 
 import autogen
 
+from agents import create_user_proxy
+
+logger = logging.getLogger(__name__)
+
+# Patterns used to clean and verify story transcripts
+_STORY_NUM_ARTIFACT = re.compile(r'\*?\s*\(Story \d+.*?\)')
+_STORY_NUM_LINE = re.compile(r'\*?\s*Story \d+.*?\n')
+# Tags whose text is extracted from the transcript
+_INDEXED_TAGS = ("SCENE FINAL:", "SCENE:", "MEMORY UPDATE:")
+# Tags marking each step of the story sequence, as bits of the verification
+# state; "SCENE:" never matches inside "SCENE FINAL:"
+_TAGS = (
+    ("MEMORY UPDATE:", 1),
+    ("PLAN:", 2),
+    ("SETTING:", 4),
+    ("SCENE:", 8),
+    ("FEEDBACK:", 16),
+    ("SCENE FINAL:", 32),
+)
+_CONFIRMED = 64  # "**Confirmation:**" reporting success
+_ALL = 127
+
+
+def _scan_tags(text: str, state: int = 0) -> int:
+    """Add the bits of the step tags found in the text to state, see _TAGS
+
+    Tags whose bit is already set are not searched again.
+    """
+    for tag, bit in _TAGS:
+        if not state & bit and tag in text:
+            state |= bit
+    return state
+
+
+# Static instructions come first so every story shares the same prompt
+# prefix; only the tail changes between stories
+_STORY_PROMPT_TMPL = """IMPORTANT: Wait for confirmation before proceeding.
+IMPORTANT: Generate only the story given below. Do not proceed to next story until explicitly instructed.
+DO  END THE STORY HERE.
+
+Follow this exact sequence for this story only:
+
+1. Memory Keeper: Context (MEMORY UPDATE)
+2. Writer: Draft (STORY)
+3. Editor: Review (FEEDBACK)
+4. Writer Final: Revision (STORY FINAL)
+
+Wait for each step to complete before proceeding.
+
+Current Task: Generate Story {n} content only.
+
+Story {n} memory:
+{context}
+
+Title: {title}
+Requirements:
+{prompt}"""
+
+
+@dataclass
+class Analysis:
+    """What a story transcript produced, gathered in one pass over it"""
+    story_number: int
+    scene_final: Optional[str]
+    memory_update: Optional[str]
+    state: int  # Bits of the completed steps, see _TAGS
+
 
 class StoryGenerator:
     def __init__(self, agents: Dict[str, autogen.ConversableAgent], agent_config: Dict, outline: List[Dict]):
@@ -13,16 +87,46 @@ class StoryGenerator:
         self.agents = agents
         self.agent_config = agent_config
         self.output_dir = "story_output"
-        self.stories_memory = []  # Store stories summaries
+        self.stories_memory = deque(maxlen=5)  # (story_number, summary) of the latest stories
+        self._rollup = ""  # Condensed summary of the stories dropped from stories_memory
+        self._rollup_lock = None  # Created in generate_stories
+        self._rollup_tasks = set()
+        # (story_number, summary) dropped from stories_memory or replaced after
+        # that, kept in the context until folded into the rollup
+        self._pending_rollup = []
+        # story_number -> digest of its recorded summary, for transcript cache keys
+        self._summary_digests = {}
         self.max_iterations = 3  # Limit editor-writer iterations
         self.outline = outline  # Store the outline
+        self.concurrency_limit = 3  # Limit stories generated at the same time
+        self.speculative_limit = 1  # Limit speculative retries running at the same time
+        # Created in generate_stories so it belongs to the event loop the
+        # stories run in
+        self._retry_semaphore = None
+        self._memory_recorded = {}  # story_number -> asyncio.Event set once its summary is stored
+        self._cache_dir = os.path.join(self.output_dir, ".cache")  # Cached story transcripts
+        self.use_cache = os.getenv("STORYGEN_CACHE", "1") != "0"
+        self._verified = {}  # story_number -> whether the saved story passed verification
+        self._agent_pool = []  # Idle per-story agent sets, reused across stories
+        self._manager_story = {}  # id(GroupChatManager) -> story_number it is generating
+        self._finalized = set()  # Stories whose results were saved by a winning attempt
+        self._finalize_lock = None  # Created in generate_stories
+        # Seconds before the simplified retry is started alongside a slow story
+        self.speculative_retry_after = float(os.getenv("STORYGEN_SPECULATIVE_AFTER", "300"))
+        # The outline doesn't change, so it is sorted and formatted once
+        self._sorted_outline = sorted(outline, key=itemgetter('story_number'))
+        self._outline_by_num = {ch['story_number']: ch for ch in outline}
+        self._outline_context = "\n".join(
+            f"\nStory {ch['story_number']}: {ch['title']}\n{ch['prompt']}"
+            for ch in self._sorted_outline
+        )
         os.makedirs(self.output_dir, exist_ok=True)
 
     def _clean_story_content(self, content: str) -> str:
         """Clean up story content by removing artifacts and story numbers"""
         # Remove story number references
-        content = re.sub(r'\*?\s*\(Story \d+.*?\)', '', content)
-        content = re.sub(r'\*?\s*Story \d+.*?\n', '', content, count=1)
+        content = _STORY_NUM_ARTIFACT.sub('', content)
+        content = _STORY_NUM_LINE.sub('', content, count=1)
         
         # Clean up any remaining markdown artifacts
         content = content.replace('*', '')
@@ -30,31 +134,63 @@ class StoryGenerator:
         
         return content
     
-    def initiate_group_chat(self) -> autogen.GroupChat:
-        """Create a new group chat for the agents with improved speaking order"""
-        outline_context = "\n".join([
-            f"\nStory {ch['story_number']}: {ch['title']}\n{ch['prompt']}"
-            for ch in sorted(self.outline, key=lambda x: x['story_number'])
-        ])
+    def _clone_agent(self, agent: autogen.ConversableAgent, name: Optional[str] = None) -> autogen.AssistantAgent:
+        """Create a fresh copy of an assistant agent with no conversation state"""
+        return autogen.AssistantAgent(
+            name=name or agent.name,
+            system_message=agent.system_message,
+            llm_config=agent.llm_config
+        )
+
+    def _create_story_agents(self) -> Dict[str, autogen.ConversableAgent]:
+        """Create an isolated set of agents for one story at a time
+
+        Stories are generated concurrently, so each running story gets its own
+        copies of the agents, user proxy included, to avoid sharing
+        conversation history.
+        Sets are pooled, so writer_final and the other copies are only built
+        once per concurrently running story rather than once per story.
+        """
+        agents = {
+            name: self._clone_agent(self.agents[name])
+            for name in ("memory_keeper", "writer", "editor", "story_planner")
+        }
+        agents["writer_final"] = self._clone_agent(self.agents["writer"], name="writer_final")
+        agents["user_proxy"] = create_user_proxy(human_input_mode="NEVER")
+
+        # The next story only needs the summary, so record it before the
+        # writer and editor rounds finish
+        agents["memory_keeper"].register_hook("process_message_before_send", self._memory_update_hook)
+        return agents
+
+    def _acquire_story_agents(self) -> Dict[str, autogen.ConversableAgent]:
+        """Take an idle agent set from the pool, or create one"""
+        if not self._agent_pool:
+            return self._create_story_agents()
+
+        agents = self._agent_pool.pop()
+        for agent in agents.values():
+            agent.reset()
+        return agents
 
+    def _release_story_agents(self, agents: Dict[str, autogen.ConversableAgent]) -> None:
+        """Return an agent set to the pool once its story is done"""
+        self._agent_pool.append(agents)
+
+    def initiate_group_chat(self, agents: Dict[str, autogen.ConversableAgent]) -> autogen.GroupChat:
+        """Create a new group chat for the agents with improved speaking order"""
         messages = [{
             "role": "system",
-            "content": f"Complete Book Outline:\n{outline_context}"
+            "content": f"Complete Book Outline:\n{self._outline_context}"
         }]
 
-        writer_final = autogen.AssistantAgent(
-            name="writer_final",
-            system_message=self.agents["writer"].system_message,
-            llm_config=self.agent_config
-        )
-        
         return autogen.GroupChat(
             agents=[
-                self.agents["user_proxy"],
-                self.agents["memory_keeper"],
-                self.agents["writer"],
-                self.agents["editor"],
-                writer_final
+                agents["user_proxy"],
+                agents["memory_keeper"],
+                agents["writer"],
+                agents["editor"],
+                agents["writer_final"]
             ],
             messages=messages,
             max_round=5,
@@ -65,164 +201,352 @@ class StoryGenerator:
         """Helper to get sender from message regardless of format"""
         return msg.get("sender") or msg.get("name", "")
 
-    def _verify_story_complete(self, messages: List[Dict]) -> bool:
-        """Verify story completion by analyzing entire conversation context"""
+    def _analyze_messages(self, messages: List[Dict], story_number: int) -> Analysis:
+        """Analyze a story transcript in one forward pass
+
+        Tracks the completed steps while indexing, for
+        each (sender, tag), the text after the tag in the last message from
+        that sender containing it, plus (sender, "RAW") for the last message
+        with enough raw content. The final scene and memory update are then
+        picked from that index. The pass stops once every step is found and
+        writer_final has sent its final scene, since writer_final speaks last
+        and later messages can't change the result.
+        """
         print("******************** VERIFYING STORY COMPLETION ****************")
-        current_story = None
-        story_content = None
-        sequence_complete = {
-            'memory_update': False,
-            'plan': False,
-            'setting': False,
-            'scene': False,
-            'feedback': False,
-            'scene_final': False,
-            'confirmation': False
-        }
-        
-        # Analyze full conversation
+        state = 0  # Bits of the completed steps, see _TAGS
+        index = {}
+
         for msg in messages:
-            content = msg.get("content", "")
-            
-            # Track story number
-            if not current_story:
-                num_match = re.search(r"Story (\d+):", content)
-                if num_match:
-                    current_story = int(num_match.group(1))
-            
-            # Track completion sequence
-            if "MEMORY UPDATE:" in content: sequence_complete['memory_update'] = True
-            if "PLAN:" in content: sequence_complete['plan'] = True
-            if "SETTING:" in content: sequence_complete['setting'] = True
-            if "SCENE:" in content: sequence_complete['scene'] = True
-            if "FEEDBACK:" in content: sequence_complete['feedback'] = True
-            if "SCENE FINAL:" in content:
-                sequence_complete['scene_final'] = True
-                story_content = content.split("SCENE FINAL:")[1].strip()
-            if "**Confirmation:**" in content and "successfully" in content:
-                sequence_complete['confirmation'] = True
-
-            #print all sequence_complete flags
-            print("******************** SEQUENCE COMPLETE **************", sequence_complete)
-            print("******************** CURRENT_STORY ****************", current_story)
-            print("******************** STORY_CONTENT ****************", story_content)
-        
-        # Verify all steps completed and content exists
-        if all(sequence_complete.values()) and current_story and story_content:
-            self._save_story(current_story, story_content)
-            return True
-            
-        return False
-    
+            content = msg.get("content") or ""
+            sender = self._get_sender(msg)
+            # The prompts sent by the user proxy embed earlier story summaries,
+            # which may quote the step tags themselves
+            if sender == "user_proxy":
+                continue
+
+            state = _scan_tags(content, state)
+            if not state & _CONFIRMED and "**Confirmation:**" in content and "successfully" in content:
+                state |= _CONFIRMED
+
+            for tag in _INDEXED_TAGS:
+                _, sep, text = content.partition(tag)
+                text = text.strip()
+                if sep and text:
+                    index[(sender, tag)] = text
+            stripped = content.strip()
+            if len(stripped) > 100:  # Minimum content threshold
+                index[(sender, "RAW")] = stripped
+
+            if (state == _ALL and ("writer_final", "SCENE FINAL:") in index
+                    and ("memory_keeper", "MEMORY UPDATE:") in index):
+                break
+
+        logger.debug("seq=%#x story=%s", state, story_number)
+
+        analysis = Analysis(
+            story_number=story_number,
+            scene_final=self._extract_final_scene(index),
+            memory_update=index.get(("memory_keeper", "MEMORY UPDATE:")),
+            state=state
+        )
+        print(f"Story {story_number}: completed steps {bin(state).count('1')}"
+              f"/{len(_TAGS) + 1}, final scene {len(analysis.scene_final or '')} chars")
+        return analysis
+
+    def _is_complete(self, analysis: Analysis) -> bool:
+        """Check every step was completed and there is a story to save"""
+        return bool(analysis.state == _ALL and analysis.scene_final)
+
     def _prepare_story_context(self, story_number: int, prompt: str) -> str:
-        """Prepare context for story generation"""
+        """Prepare context for story generation
+
+        Only the latest summaries are included, with older stories condensed
+        into a single rollup, so the prompt stays the same size as the book
+        grows. Summaries still waiting to be condensed are listed as they are,
+        so building the context never waits for the rollup.
+        """
         if story_number == 1:
             return f"Initial Story\nRequirements:\n{prompt}"
             
-        context_parts = [
-            "Previous Story Summaries:",
-            *[f"Story {i+1}: {summary}" for i, summary in enumerate(self.stories_memory)],
-            "\nCurrent Story Requirements:",
-            prompt
-        ]
+        context_parts = []
+        if self._rollup:
+            context_parts.append(f"Earlier summary (the stories below take precedence): {self._rollup}\n")
+        context_parts.append("Previous Stories:")
+        context_parts.extend(
+            f"Story {number} - {summary}" for number, summary in self._pending_rollup
+        )
+        context_parts.extend(
+            f"Story {number} - {summary}" for number, summary in self.stories_memory
+        )
+        context_parts.append("\nCurrent Story Requirements:")
+        context_parts.append(prompt)
         return "\n".join(context_parts)
 
-    def generate_story(self, story_number: int, prompt: str) -> None:
-        """Generate a single story with completion verification"""
+    def _record_memory(self, story_number: int, summary: str, replace: bool = False) -> None:
+        """Store a story summary once and release the stories waiting for it
+
+        The memory keeper's summary is recorded as soon as it is sent so the
+        next story can start early. Once a story is saved, its winning attempt
+        records again with replace, so the stored summary matches the story
+        that was actually saved.
+        """
+        recorded = self._memory_recorded.setdefault(story_number, asyncio.Event())
+        if recorded.is_set():
+            if replace:
+                self._replace_memory(story_number, summary)
+            return
+        # Fold the summary about to be evicted into the rollup in the
+        # background; it stays in the context until then
+        if len(self.stories_memory) == self.stories_memory.maxlen:
+            self._pending_rollup.append(self.stories_memory[0])
+            self._schedule_rollup()
+        self.stories_memory.append((story_number, summary))
+        self._summary_digests[story_number] = self._digest(summary)
+        recorded.set()
+
+    def _replace_memory(self, story_number: int, summary: str) -> None:
+        """Replace the recorded summary of a story, wherever it is held"""
+        self._summary_digests[story_number] = self._digest(summary)
+        for i, (number, _) in enumerate(self.stories_memory):
+            if number == story_number:
+                self.stories_memory[i] = (story_number, summary)
+                return
+
+        # Already evicted: queue the new summary so the rollup is corrected,
+        # dropping the old one if it hasn't been folded in yet
+        self._pending_rollup = [item for item in self._pending_rollup if item[0] != story_number]
+        self._pending_rollup.append((story_number, summary))
+        self._schedule_rollup()
+
+    def _schedule_rollup(self) -> None:
+        """Start folding the pending summaries into the rollup in the background"""
+        task = asyncio.create_task(self._compress_summaries())
+        self._rollup_tasks.add(task)
+        task.add_done_callback(self._rollup_tasks.discard)
+
+    async def _compress_summaries(self) -> None:
+        """Condense the summaries pending in _pending_rollup into the rollup"""
+        async with self._rollup_lock:
+            # An earlier run may have folded everything already
+            summaries = list(self._pending_rollup)
+            if not summaries:
+                return
+            evicted = "\n".join(f"Story {number} - {summary}" for number, summary in summaries)
+            compress_prompt = f"""Condense the summary of the book so far and the story summaries below into one short summary.
+Keep the characters, world details and events that later stories depend on.
+A story listed below replaces what the summary so far says about it.
+
+Summary so far:
+{self._rollup or "None"}
+
+Stories to add:
+{evicted}"""
+            try:
+                reply = await self.agents["memory_keeper"].a_generate_reply(
+                    messages=[{"role": "user", "content": compress_prompt}]
+                )
+                content = reply.get("content") if isinstance(reply, dict) else reply
+            except Exception as e:
+                print(f"Error condensing earlier summaries: {str(e)}")
+                content = None
+            # Keep the summaries uncondensed rather than losing them
+            self._rollup = (content or "").strip() or "\n".join(filter(None, [self._rollup, evicted]))
+            # Summaries queued or replaced while condensing stay pending
+            self._pending_rollup = [item for item in self._pending_rollup if item not in summaries]
+
+    def _memory_update_hook(self, sender, message, recipient, silent):
+        """Record the memory keeper's summary as soon as it is sent to a story chat"""
+        story_number = self._manager_story.get(id(recipient))
+        content = message.get("content") if isinstance(message, dict) else message
+        _, sep, update = (content or "").partition("MEMORY UPDATE:")
+        if story_number is not None and sep:
+            self._record_memory(story_number, update.strip())
+        return message
+
+    def _digest(self, text: str) -> str:
+        """Get a short stable digest of some text"""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _transcript_cache_file(self, story_number: int, prompt: str) -> str:
+        """Get the cache file for a story transcript
+
+        Keyed on the inputs of the request rather than the rendered prompt,
+        which includes the rollup the LLM condenses differently on every run.
+        """
+        earlier = [
+            [number, digest] for number, digest in sorted(self._summary_digests.items())
+            if number < story_number
+        ]
+        key = self._digest(json.dumps(
+            [_STORY_PROMPT_TMPL, story_number, self._outline_by_num[story_number], prompt, earlier],
+            ensure_ascii=False
+        ))
+        return os.path.join(self._cache_dir, f"{key}.json")
+
+    def _load_cached_transcript(self, cache_file: str) -> Optional[List[Dict]]:
+        """Load a cached story transcript, if caching is enabled and it exists"""
+        if not self.use_cache or not os.path.exists(cache_file):
+            return None
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_cached_transcript(self, cache_file: str, messages: List[Dict]) -> None:
+        """Save a successful story transcript for reuse on reruns"""
+        if not self.use_cache:
+            return
+        os.makedirs(self._cache_dir, exist_ok=True)
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(messages, f, ensure_ascii=False, default=str)
+
+    async def generate_story(self, story_number: int, prompt: str) -> None:
+        """Generate a single story with completion verification
+
+        If the full agent sequence fails, or is still running after
+        speculative_retry_after seconds, the simplified retry is started next
+        to it and whichever attempt succeeds first is kept.
+        """
         print(f"\nGenerating story {story_number}...")
-        
+        agents = self._acquire_story_agents()
+        primary = asyncio.create_task(self._primary_attempt(story_number, prompt, agents))
+        pending = {primary}
+
         try:
-            # Create group chat with reduced rounds
-            groupchat = self.initiate_group_chat()
-            manager = autogen.GroupChatManager(
-                groupchat=groupchat,
-                llm_config=self.agent_config
-            )
+            done, _ = await asyncio.wait(pending, timeout=self.speculative_retry_after)
+            if done:
+                # A False result means another attempt already saved the story
+                if primary.exception() is None:
+                    return
+                print(f"Error in story {story_number}: {str(primary.exception())}")
+                # The failed primary held this story's slot, so the retry runs in it
+                retry = self._handle_story_generation_failure(story_number, prompt)
+                pending.clear()
+            else:
+                print(f"Story {story_number} is taking long, starting a speculative retry...")
+                retry = self._speculative_retry(story_number, prompt)
+            pending.add(asyncio.create_task(retry))
+
+            # Take the first attempt that succeeds
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return
+                    if task is primary:
+                        print(f"Error in story {story_number}: {str(task.exception())}")
+            print("Unable to generate story content after retry")
 
+        finally:
+            for task in pending:
+                task.cancel()
+            # Let cancelled attempts unwind before their agents are reused
+            await asyncio.gather(*pending, return_exceptions=True)
+            self._release_story_agents(agents)
+
+    async def _primary_attempt(self, story_number: int, prompt: str,
+                               agents: Dict[str, autogen.ConversableAgent]) -> bool:
+        """Run the full agent sequence for a story, returning whether it was kept"""
+        manager = None
+
+        try:
             # Prepare context
             context = self._prepare_story_context(story_number, prompt)
-            story_prompt = f"""
-            IMPORTANT: Wait for confirmation before proceeding.
-            IMPORTANT: This is Story {story_number}. Do not proceed to next story until explicitly instructed.
-            DO  END THE STORY HERE.
+            story_prompt = _STORY_PROMPT_TMPL.format_map({
+                'n': story_number,
+                'title': self._outline_by_num[story_number]['title'],
+                'prompt': prompt,
+                'context': context
+            })
 
-            Current Task: Generate Story {story_number} content only.
-
-            Story Outline:
-            Title: {self.outline[story_number - 1]['title']}
+            # Reuse the transcript of an identical earlier request
+            cache_file = self._transcript_cache_file(story_number, prompt)
+            messages = self._load_cached_transcript(cache_file)
+            if messages is not None:
+                print(f"Using cached transcript for story {story_number}")
+            else:
+                # Create group chat with reduced rounds
+                groupchat = self.initiate_group_chat(agents)
+                manager = autogen.GroupChatManager(
+                    groupchat=groupchat,
+                    llm_config=self.agent_config
+                )
+                self._manager_story[id(manager)] = story_number
 
-            Story Requirements:
-            {prompt}
+                # Start generation
+                await agents["user_proxy"].a_initiate_chat(
+                    manager,
+                    message=story_prompt
+                )
+                messages = groupchat.messages
 
-            Previous Context for Reference:
-            {context}
+            analysis = self._analyze_messages(messages, story_number)
+            if not self._is_complete(analysis):
+                raise ValueError(f"Story {story_number} generation incomplete")
 
-            Follow this exact sequence for Story {story_number} only:
+            if not await asyncio.shield(self._finalize_story(story_number, analysis)):
+                return False
 
-            1. Memory Keeper: Context (MEMORY UPDATE)
-            2. Writer: Draft (STORY)
-            3. Editor: Review (FEEDBACK)
-            4. Writer Final: Revision (STORY FINAL)
+            if manager is not None:
+                self._save_cached_transcript(cache_file, messages)
+                completion_msg = f"Story {story_number} is complete. Proceed with next story."
+                await agents["user_proxy"].a_send(completion_msg, manager)
+            return True
 
-            Wait for each step to complete before proceeding."""
+        finally:
+            if manager is not None:
+                self._manager_story.pop(id(manager), None)
 
-            # Start generation
-            self.agents["user_proxy"].initiate_chat(
-                manager,
-                message=story_prompt
-            )
+    async def _finalize_story(self, story_number: int, analysis: Analysis) -> bool:
+        """Save the results of the first successful attempt at a story
 
-            if not self._verify_story_complete(groupchat.messages):
-                raise ValueError(f"Story {story_prompt} generation incomplete")
-        
-            self._process_story_results(story_number, groupchat.messages)
-            story_file = os.path.join(self.output_dir, f"story_{story_number:02d}.txt")
-            if not os.path.exists(story_file):
-                raise FileNotFoundError(f"Story {story_number} file not created")
-        
-            completion_msg = f"Story {story_number} is complete. Proceed with next story."
-            self.agents["user_proxy"].send(completion_msg, manager)
-            
-        except Exception as e:
-            print(f"Error in story {story_number}: {str(e)}")
-            self._handle_story_generation_failure(story_number, prompt)
+        Returns False without touching files or memory if another attempt
+        already finalized the story. Callers shield it: the file write runs in
+        an executor thread that cancellation can't stop, so the save and the
+        memory update are always completed together.
+        """
+        async with self._finalize_lock:
+            if story_number in self._finalized:
+                return False
+            await self._process_story_results(story_number, analysis)
+            if not self._verified.get(story_number):
+                raise ValueError(f"Story {story_number} content invalid")
+            self._finalized.add(story_number)
+            return True
 
-    def _extract_final_scene(self, messages: List[Dict]) -> Optional[str]:
+    def _extract_final_scene(self, index: Dict[Tuple[str, str], str]) -> Optional[str]:
         """Extract story content with improved content detection"""
-        for msg in reversed(messages):
-            content = msg.get("content", "")
-            sender = self._get_sender(msg)
-            
-            if sender in ["writer", "writer_final"]:
-                # Handle complete scene content
-                if "SCENE FINAL:" in content:
-                    scene_text = content.split("SCENE FINAL:")[1].strip()
-                    if scene_text:
-                        return scene_text
-                        
-                # Fallback to scene content
-                if "SCENE:" in content:
-                    scene_text = content.split("SCENE:")[1].strip()
-                    if scene_text:
-                        return scene_text
-                        
-                # Handle raw content
-                if len(content.strip()) > 100:  # Minimum content threshold
-                    return content.strip()
-                    
+        # Prefer final scenes, then drafts, then raw writer content
+        for tag in ("SCENE FINAL:", "SCENE:", "RAW"):
+            for sender in ("writer_final", "writer"):
+                scene_text = index.get((sender, tag))
+                if scene_text:
+                    return scene_text
         return None
 
-    def _handle_story_generation_failure(self, story_number: int, prompt: str) -> None:
-        """Handle failed story generation with simplified retry"""
+    async def _speculative_retry(self, story_number: int, prompt: str) -> bool:
+        """Run the simplified retry next to a slow attempt
+
+        The slow attempt still holds its story slot, so retries are bounded by
+        their own semaphore rather than waiting for another story's slot.
+        """
+        async with self._retry_semaphore:
+            return await self._handle_story_generation_failure(story_number, prompt)
+
+    async def _handle_story_generation_failure(self, story_number: int, prompt: str) -> bool:
+        """Handle failed or slow story generation with simplified retry
+
+        The retry may run while the full attempt is still going, so it uses
+        its own user proxy and copies of the planner and writer.
+        """
         print(f"Attempting simplified retry for Story {story_number}...")
         
         try:
             # Create a new group chat with just essential agents
+            user_proxy = create_user_proxy(human_input_mode="NEVER")
             retry_groupchat = autogen.GroupChat(
                 agents=[
-                    self.agents["user_proxy"],
-                    self.agents["story_planner"],
-                    self.agents["writer"]
+                    user_proxy,
+                    self._clone_agent(self.agents["story_planner"]),
+                    self._clone_agent(self.agents["writer"])
                 ],
                 messages=[],
                 max_round=3
@@ -243,124 +567,92 @@ Please generate this story in two steps:
 
 Keep it simple and direct."""
 
-            self.agents["user_proxy"].initiate_chat(
+            await user_proxy.a_initiate_chat(
                 manager,
                 message=retry_prompt
             )
             
-            # Save the retry results
-            self._process_story_results(story_number, retry_groupchat.messages)
+            # Save the retry results unless the full attempt got there first
+            analysis = self._analyze_messages(retry_groupchat.messages, story_number)
+            return await asyncio.shield(self._finalize_story(story_number, analysis))
             
         except Exception as e:
             print(f"Error in retry attempt for Story {story_number}: {str(e)}")
-            print("Unable to generate story content after retry")
+            raise
 
-    def _process_story_results(self, story_number: int, messages: List[Dict]) -> None:
-        """Process and save story results, updating memory"""
+    async def _process_story_results(self, story_number: int, analysis: Analysis) -> None:
+        """Process, save and verify story results, updating memory"""
         try:
-            # Extract the Memory Keeper's final summary
-            memory_updates = []
-            for msg in reversed(messages):
-                sender = self._get_sender(msg)
-                content = msg.get("content", "")
-                
-                if sender == "memory_keeper" and "MEMORY UPDATE:" in content:
-                    update_start = content.find("MEMORY UPDATE:") + 14
-                    memory_updates.append(content[update_start:].strip())
-                    break
-            
-            # Add to memory even if no explicit update (use basic content summary)
-            if memory_updates:
-                self.stories_memory.append(memory_updates[0])
+            # Extract and save the story content, verifying what was written
+            saved_content = await self._save_story(story_number, analysis)
+            self._verified[story_number] = self._verify_story_content(saved_content, story_number)
+            if not self._verified[story_number]:
+                return
+
+            # Add to memory even if no explicit update (use basic content summary),
+            # replacing any summary recorded early by another attempt
+            if analysis.memory_update:
+                self._record_memory(story_number, analysis.memory_update, replace=True)
             else:
                 # Create basic memory from story content
-                story_content = self._extract_final_scene(messages)
+                story_content = analysis.scene_final
                 if story_content:
                     basic_summary = f"Story {story_number} Summary: {story_content[:200]}..."
-                    self.stories_memory.append(basic_summary)
-            
-            # Extract and save the story content
-            self._save_story(story_number, messages)
+                    self._record_memory(story_number, basic_summary, replace=True)
             
         except Exception as e:
             print(f"Error processing story results: {str(e)}")
             raise
 
-    def _save_story(self, story_number: int, messages: List[Dict]) -> None:
+    async def _save_story(self, story_number: int, analysis: Analysis) -> str:
+        """Save the story to its file and return the written content
+
+        The file I/O runs in a worker thread so other stories keep talking to
+        the LLM while it is written.
+        """
         print(f"\nSaving Story {story_number}")
         try:
-            story_content = self._extract_final_scene(messages)
+            story_content = analysis.scene_final
             if not story_content:
-                raise ValueError(f"No content found for Story {story_content}")
+                raise ValueError(f"No content found for Story {story_number}")
                 
             story_content = self._clean_story_content(story_content)
             
             filename = os.path.join(self.output_dir, f"story_{story_number:02d}.txt")
-            
-            # Create backup if file exists
-            if os.path.exists(filename):
-                backup_filename = f"{filename}.backup"
-                import shutil
-                shutil.copy2(filename, backup_filename)
-                
-            with open(filename, "w", encoding='utf-8') as f:
-                f.write(f"Story {story_number}\n\n{story_content}")
-                
-            # Verify file
-            with open(filename, "r", encoding='utf-8') as f:
-                saved_content = f.read()
-                if len(saved_content.strip()) == 0:
-                    raise IOError(f"File {filename} is empty")
+            header = f"Story {story_number}\n\n"
+            saved_content = header + story_content
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._write_story_file, filename, header, saved_content
+            )
                     
             print(f"✓ Saved to: {filename}")
+            return saved_content
             
         except Exception as e:
             print(f"Error saving story: {str(e)}")
             raise
 
-    def generate_stories(self, outline: List[Dict]) -> None:
-        """Generate the stories with strict story sequencing"""
-        print("\nStarting story Generation...")
-        print(f"Total stories: {len(outline)}")
-        
-        # Sort outline by story number
-        sorted_outline = sorted(outline, key=lambda x: x["story_number"])
-        
-        for story in sorted_outline:
-            story_number = story["story_number"]
-            
-            # Verify previous story exists and is valid
-            if story_number > 1:
-                prev_file = os.path.join(self.output_dir, f"story_{story_number-1:02d}.txt")
-                if not os.path.exists(prev_file):
-                    print(f"Previous story {story_number-1} not found. Stopping.")
-                    break
-                    
-                # Verify previous story content
-                with open(prev_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if not self._verify_story_content(content, story_number-1):
-                        print(f"Previous story {story_number-1} content invalid. Stopping.")
-                        break
+    def _write_story_file(self, filename: str, header: str, content: str) -> None:
+        """Write a story file, backing up the previous version"""
+        # Create backup if file exists
+        if os.path.exists(filename):
+            shutil.copy2(filename, f"{filename}.backup")
             
-            # Generate current story
-            print(f"\n{'='*20} Story {story_number} {'='*20}")
-            self.generate_story(story_number, story["prompt"])
-            
-            # Verify current story
-            story_file = os.path.join(self.output_dir, f"story_{story_number:02d}.txt")
-            if not os.path.exists(story_file):
-                print(f"Failed to generate story {story_number}")
-                break
-                
-            with open(story_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if not self._verify_story_content(content, story_number):
-                    print(f"Story {story_number} content invalid")
-                    break
-                    
-            print(f"✓ Story {story_number} complete")
-            time.sleep(5)
+        # Write to a temporary file and swap it in, so a failed write never
+        # leaves a truncated story behind
+        tmp_filename = f"{filename}.tmp"
+        try:
+            with open(tmp_filename, "w", encoding='utf-8') as f:
+                f.write(content)
+
+            # Verify file has more than its header, without reading it back
+            if os.path.getsize(tmp_filename) <= len(header):
+                raise IOError(f"File {filename} is empty")
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+        os.replace(tmp_filename, filename)
 
     def _verify_story_content(self, content: str, story_number: int) -> bool:
         """Verify story content is valid"""
@@ -375,4 +667,59 @@ Keep it simple and direct."""
         lines = content.split('\n')
         content_lines = [line for line in lines if line.strip() and 'MEMORY UPDATE:' not in line]
         
-        return len(content_lines) >= 3  # At least story header + 2 content lines
\ No newline at end of file
+        return len(content_lines) >= 3  # At least story header + 2 content lines
+
+    async def _run_story(self, story: Dict, previous: Optional[asyncio.Event],
+                         semaphore: asyncio.Semaphore) -> None:
+        """Generate one story once the summaries of the previous stories exist"""
+        story_number = story["story_number"]
+        try:
+            if previous is not None:
+                await previous.wait()
+
+            async with semaphore:
+                print(f"\n{'='*20} Story {story_number} {'='*20}")
+                await self.generate_story(story_number, story["prompt"])
+                await asyncio.sleep(5)
+        finally:
+            # Never leave later stories waiting on a failed one
+            self._memory_recorded[story_number].set()
+
+    async def generate_stories(self, outline: List[Dict]) -> None:
+        """Generate the stories concurrently
+
+        Story N only needs the summaries of stories 1..N-1, so it starts as
+        soon as the memory keeper of story N-1 has produced its summary, while
+        the writer and editor of earlier stories are still working.
+        """
+        print("\nStarting story Generation...")
+        print(f"Total stories: {len(outline)}")
+        
+        # Sort outline by story number, reusing the order computed in __init__
+        if outline is self.outline:
+            sorted_outline = self._sorted_outline
+        else:
+            sorted_outline = sorted(outline, key=itemgetter("story_number"))
+        self._memory_recorded = {story["story_number"]: asyncio.Event() for story in sorted_outline}
+        semaphore = asyncio.Semaphore(self.concurrency_limit)
+        self._retry_semaphore = asyncio.Semaphore(self.speculative_limit)
+        self._finalize_lock = asyncio.Lock()
+        self._rollup_lock = asyncio.Lock()
+
+        previous = None
+        tasks = []
+        for story in sorted_outline:
+            tasks.append(self._run_story(story, previous, semaphore))
+            previous = self._memory_recorded[story["story_number"]]
+        await asyncio.gather(*tasks)
+        await asyncio.gather(*self._rollup_tasks)
+
+        # Report results, using the verification done when each story was saved
+        for story in sorted_outline:
+            story_number = story["story_number"]
+            if story_number not in self._verified:
+                print(f"Failed to generate story {story_number}")
+            elif not self._verified[story_number]:
+                print(f"Story {story_number} content invalid")
+            else:
+                print(f"✓ Story {story_number} complete")